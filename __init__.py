@@ -2,19 +2,30 @@
 
 import os
 import os.path
+import base64
 import sys
 import time
 import glob
+import functools
+import hashlib
 import http.cookiejar
 import tempfile
+import threading
+import shutil
 import lz4.block
-import datetime
 import configparser
+import pathlib
+from contextlib import closing
 
 try:
     import json
 except ImportError:
     import simplejson as json
+try:
+    # orjson parses bytes directly and is considerably faster
+    import orjson
+except ImportError:
+    orjson = None
 try:
     # should use pysqlite2 to read the cookies.sqlite on Windows
     # otherwise will raise the "sqlite3.DatabaseError: file is encrypted or is not a database" exception
@@ -24,8 +35,14 @@ except ImportError:
 
 # external dependencies
 import keyring
-import pyaes
-from pbkdf2 import PBKDF2
+try:
+    # prefer the OpenSSL backed AES implementation, fall back to pure python pyaes
+    from cryptography.hazmat.backends import default_backend
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+except ImportError:
+    Cipher = None
+    import pyaes
 
 __doc__ = 'Load browser cookies into a cookiejar'
 
@@ -34,6 +51,34 @@ class BrowserCookieError(Exception):
     pass
 
 
+def _derive_key(password, salt, iterations, length):
+    """Derive the Chrome AES key with PBKDF2-HMAC-SHA1.
+    Chrome keys are 16 bytes, i.e. a single SHA-1 block, so there are no PBKDF2 blocks to
+    derive in parallel; hashlib runs the whole iteration loop in C.
+    """
+    return hashlib.pbkdf2_hmac('sha1', password, salt, iterations, dklen=length)
+
+
+# chrome linux is encrypted with the key peanuts, one pbkdf2 iteration
+_LINUX_CHROME_KEY = hashlib.pbkdf2_hmac('sha1', b'peanuts', b'saltysalt', 1, dklen=16)
+
+
+def _first_existing(*candidates):
+    """Return the first candidate path that exists, or None.
+    Only patterns containing wildcards go through glob, literal paths just need a stat.
+    """
+    for candidate in candidates:
+        if not candidate:
+            continue
+        if '*' in candidate or '?' in candidate:
+            matches = glob.glob(candidate)
+            if matches:
+                return matches[0]
+        elif os.path.isfile(candidate):
+            return candidate
+    return None
+
+
 def create_local_copy(cookie_file):
     """Make a local copy of the sqlite cookie database and return the new filename.
     This is necessary in case this database is still being written to while the user browses
@@ -42,13 +87,26 @@ def create_local_copy(cookie_file):
     # check if cookie file exists
     if os.path.exists(cookie_file):
         # copy to random name in tmp folder
-        tmp_cookie_file = tempfile.NamedTemporaryFile(suffix='.sqlite').name
-        open(tmp_cookie_file, 'wb').write(open(cookie_file, 'rb').read())
+        # close the file before copying, windows does not allow opening it twice
+        with tempfile.NamedTemporaryFile(suffix='.sqlite', delete=False) as tmp_file:
+            tmp_cookie_file = tmp_file.name
+        shutil.copyfile(cookie_file, tmp_cookie_file)
         return tmp_cookie_file
     else:
         raise BrowserCookieError('Can not find cookie file at: ' + cookie_file)
 
 
+def connect_local_copy(tmp_cookie_file):
+    """Open a read only connection to a local copy made by create_local_copy.
+    The copy is private to us and read once, so skip locking, journaling and durability.
+    """
+    uri = pathlib.Path(tmp_cookie_file).resolve().as_uri() + '?mode=ro&immutable=1'
+    con = sqlite3.connect(uri, uri=True)
+    con.executescript('PRAGMA journal_mode=OFF; PRAGMA synchronous=OFF; PRAGMA temp_store=MEMORY; '
+                      'PRAGMA mmap_size=268435456; PRAGMA locking_mode=EXCLUSIVE;')
+    return con
+
+
 def windows_group_policy_path():
     # we know that we're running under windows at this point so it's safe to do these imports
     from winreg import ConnectRegistry, HKEY_LOCAL_MACHINE, OpenKeyEx, QueryValueEx, REG_EXPAND_SZ, REG_SZ
@@ -65,6 +123,33 @@ def windows_group_policy_path():
     return os.path.join(user_data_dir, "Default", "Cookies")
 
 
+def windows_local_state_path(cookie_file):
+    """Return the path of the 'Local State' file in the user data directory of cookie_file
+    """
+    return os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(cookie_file))), 'Local State')
+
+
+def windows_chrome_key(cookie_file):
+    """Return the AES key used by Chrome >=80 on Windows, or None for older versions.
+    The key is stored DPAPI encrypted in the 'Local State' file of the user data directory.
+    """
+    local_state = windows_local_state_path(cookie_file)
+    if not os.path.exists(local_state):
+        return None
+    try:
+        with open(local_state, 'rb') as f:
+            encrypted_key = json.loads(f.read())['os_crypt']['encrypted_key']
+    except (ValueError, KeyError):
+        return None
+    # strip the 'DPAPI' prefix
+    encrypted_key = base64.b64decode(encrypted_key)[5:]
+    try:
+        _, key = crypt_unprotect_data(encrypted_key)
+    except RuntimeError as e:
+        raise BrowserCookieError('Failed to decrypt the Chrome key in Local State: ' + str(e))
+    return key
+
+
 # Code adapted slightly from https://github.com/Arnie97/chrome-cookies
 def crypt_unprotect_data(
         cipher_text=b'', entropy=b'', reserved=None, prompt_struct=None
@@ -79,10 +164,9 @@ def crypt_unprotect_data(
             ('pbData', ctypes.POINTER(ctypes.c_char))
         ]
 
-    blob_in, blob_entropy, blob_out = map(
-        lambda x: DataBlob(len(x), ctypes.create_string_buffer(x)),
-        [cipher_text, entropy, b'']
-    )
+    blob_in = DataBlob(len(cipher_text), ctypes.create_string_buffer(cipher_text))
+    blob_entropy = DataBlob(len(entropy), ctypes.create_string_buffer(entropy))
+    blob_out = DataBlob(0, None)
     desc = ctypes.c_wchar_p()
 
     CRYPTPROTECT_UI_FORBIDDEN = 0x01
@@ -94,10 +178,17 @@ def crypt_unprotect_data(
         raise RuntimeError('Failed to decrypt the cipher text with DPAPI')
 
     description = desc.value
-    buffer_out = ctypes.create_string_buffer(int(blob_out.cbData))
-    ctypes.memmove(buffer_out, blob_out.pbData, blob_out.cbData)
-    map(ctypes.windll.kernel32.LocalFree, [desc, blob_out.pbData])
-    return description, buffer_out.value
+    data = ctypes.string_at(blob_out.pbData, blob_out.cbData)
+    # both are allocated by CryptUnprotectData, LocalFree(NULL) is a no-op
+    ctypes.windll.kernel32.LocalFree(desc)
+    ctypes.windll.kernel32.LocalFree(blob_out.pbData)
+    return description, data
+
+
+# maps Chrome key sources to the key cookies are encrypted with, so repeated chrome()
+# calls skip the keyring lookup and the key derivation, see Chrome._key_cache_key
+_CHROME_KEYS = {}
+_CHROME_KEYS_LOCK = threading.Lock()
 
 
 class Chrome:
@@ -109,43 +200,83 @@ class Chrome:
         self.domain_name = domain_name
         if sys.platform == 'darwin':
             # running Chrome on OSX
-            my_pass = keyring.get_password('Chrome Safe Storage', 'Chrome').encode('utf8')  # get key from keyring
-            iterations = 1003  # number of pbkdf2 iterations on mac
-            self.key = PBKDF2(my_pass, self.salt, iterations=iterations).read(self.length)
             cookie_file = cookie_file \
-                or os.path.expanduser('~/Library/Application Support/Google/Chrome/Default/Cookies')
+                or _first_existing(os.path.expanduser('~/Library/Application Support/Google/Chrome/Default/Cookies'))
 
         elif sys.platform.startswith('linux'):
             # running Chrome on Linux
-            my_pass = 'peanuts'.encode('utf8')  # chrome linux is encrypted with the key peanuts
-            iterations = 1
-            self.key = PBKDF2(my_pass, self.salt, iterations=iterations).read(self.length)
-            cookie_file = cookie_file \
-                or os.path.expanduser('~/.config/google-chrome/Default/Cookies') \
-                or os.path.expanduser('~/.config/chromium/Default/Cookies') \
-                or os.path.expanduser('~/.config/google-chrome-beta/Default/Cookies')
+            cookie_file = cookie_file or _first_existing(
+                os.path.expanduser('~/.config/google-chrome/Default/Cookies'),
+                os.path.expanduser('~/.config/chromium/Default/Cookies'),
+                os.path.expanduser('~/.config/google-chrome-beta/Default/Cookies'))
         elif sys.platform == "win32":
             # get cookie file from APPDATA
             # Note: in windows the \\ is required before a u to stop unicode errors
-            cookie_file = cookie_file or windows_group_policy_path() \
-                or glob.glob(os.path.join(os.getenv('APPDATA', ''), '..\Local\\Google\\Chrome\\User Data\\Default\\Cookies')) \
-                or glob.glob(os.path.join(os.getenv('LOCALAPPDATA', ''), 'Google\\Chrome\\User Data\\Default\\Cookies')) \
-                or glob.glob(os.path.join(os.getenv('APPDATA', ''), 'Google\\Chrome\\User Data\\Default\\Cookies'))
+            cookie_file = cookie_file or _first_existing(
+                windows_group_policy_path(),
+                os.path.join(os.getenv('APPDATA', ''), '..\\Local\\Google\\Chrome\\User Data\\Default\\Cookies'),
+                os.path.join(os.getenv('LOCALAPPDATA', ''), 'Google\\Chrome\\User Data\\Default\\Cookies'),
+                os.path.join(os.getenv('APPDATA', ''), 'Google\\Chrome\\User Data\\Default\\Cookies'))
         else:
             raise BrowserCookieError("OS not recognized. Works on Chrome for OSX, Windows, and Linux.")
 
         # if the type of cookie_file is list, use the first element in the list
         if isinstance(cookie_file, list):
-            if not cookie_file:
-                raise BrowserCookieError('Failed to find Chrome cookie')
-            cookie_file = cookie_file[0]
+            cookie_file = cookie_file[0] if cookie_file else None
 
+        if not cookie_file:
+            raise BrowserCookieError('Failed to find Chrome cookie')
         self.tmp_cookie_file = create_local_copy(cookie_file)
 
+        cache_key = self._key_cache_key(cookie_file)
+        with _CHROME_KEYS_LOCK:
+            self.key = _CHROME_KEYS.get(cache_key)
+            if self.key is None:
+                self.key = self._get_key(cookie_file)
+                # a missing key may be temporary, e.g. a half written Local State, so don't cache it
+                if self.key is not None and cache_key is not None:
+                    _CHROME_KEYS[cache_key] = self.key
+
+        # build the cipher once: AES-CBC on OSX and Linux, AES-GCM for chrome >=80 on windows
+        self._cipher = None
+        if Cipher is not None and sys.platform != 'win32':
+            self._cipher = Cipher(algorithms.AES(self.key), modes.CBC(self.iv), backend=default_backend())
+        elif Cipher is not None and self.key is not None:
+            self._cipher = AESGCM(self.key)
+
+    @staticmethod
+    def _key_cache_key(cookie_file):
+        """Return the _CHROME_KEYS entry for cookie_file, or None if it can't be cached.
+        On windows the key lives in Local State, so its mtime invalidates the entry.
+        """
+        if sys.platform == 'win32':
+            local_state = windows_local_state_path(cookie_file)
+            try:
+                return local_state, os.path.getmtime(local_state)
+            except OSError:
+                return None
+        return os.path.abspath(cookie_file)
+
+    def _get_key(self, cookie_file):
+        """Return the key the cookies in cookie_file are encrypted with
+        """
+        if sys.platform == 'darwin':
+            my_pass = keyring.get_password('Chrome Safe Storage', 'Chrome').encode('utf8')  # get key from keyring
+            iterations = 1003  # number of pbkdf2 iterations on mac
+            return _derive_key(my_pass, self.salt, iterations, self.length)
+        elif sys.platform == 'win32':
+            # chrome >=80 encrypts cookies with AES-GCM using a DPAPI protected key
+            return windows_chrome_key(cookie_file)
+        return _LINUX_CHROME_KEY
+
     def __del__(self):
         # remove temporary backup of sqlite cookie database
         if hasattr(self, 'tmp_cookie_file'):  # if there was an error till here
-            os.remove(self.tmp_cookie_file)
+            try:
+                os.remove(self.tmp_cookie_file)
+            except OSError:
+                # on windows the file may still be open or mapped
+                pass
 
     def __str__(self):
         return 'chrome'
@@ -153,36 +284,30 @@ class Chrome:
     def load(self):
         """Load sqlite cookies into a cookiejar
         """
-        con = sqlite3.connect(self.tmp_cookie_file)
-        cur = con.cursor()
-        try:
-            # chrome <=55
-            cur.execute('SELECT host_key, path, secure, expires_utc, name, value, encrypted_value '
-                        'FROM cookies WHERE host_key like "%{}%";'.format(self.domain_name))
-        except sqlite3.OperationalError:
-            # chrome >=56
-            cur.execute('SELECT host_key, path, is_secure, expires_utc, name, value, encrypted_value '
-                        'FROM cookies WHERE host_key like "%{}%";'.format(self.domain_name))
+        # expires_utc counts microseconds since 1601-01-01, convert it to a unix timestamp in sqlite
+        query = 'SELECT host_key, path, {}, ' \
+                'CASE WHEN expires_utc = 0 THEN 0 ELSE expires_utc / 1000000.0 - 11644473600 END, ' \
+                'name, value, encrypted_value FROM cookies'
+        params = ()
+        if self.domain_name:
+            # browsers store hosts lower cased, instr avoids LIKE's case folding
+            query += ' WHERE instr(host_key, ?) > 0'
+            params = (self.domain_name.lower(),)
 
         cj = http.cookiejar.CookieJar()
-        epoch_start = datetime.datetime(1601,1,1)
-        for item in cur.fetchall():
-            try:
-                host, path, secure, expires, name = item[:5]
-                if item[3] != 0:
-                    delta = datetime.timedelta(microseconds=int(item[3]))
-                    expires = epoch_start + delta
-                    expires = expires.timestamp()
-                value = self._decrypt(item[5], item[6])
-                c = create_cookie(host, path, secure, expires, name, value)
-                cj.set_cookie(c)
-            except (OverflowError, OSError):
-                continue
-        con.close()
+        cookies = []
+        with closing(connect_local_copy(self.tmp_cookie_file)) as con, closing(con.cursor()) as cur:
+            columns = {row[1] for row in cur.execute('PRAGMA table_info(cookies)')}
+            # chrome >=56 renamed secure to is_secure
+            secure_column = 'is_secure' if 'is_secure' in columns else 'secure'
+            cur.execute(query.format(secure_column), params)
+            for host, path, secure, expires, name, value, encrypted_value in cur:
+                value = self._decrypt(value, encrypted_value)
+                cookies.append(create_cookie(host, path, secure, expires, name, value))
+        add_cookies(cj, cookies)
         return cj
 
-    @staticmethod
-    def _decrypt_windows_chrome(value, encrypted_value):
+    def _decrypt_windows_chrome(self, value, encrypted_value):
 
         if len(value) != 0:
             return value
@@ -190,6 +315,13 @@ class Chrome:
         if encrypted_value == "":
             return ""
 
+        if self.key is not None and encrypted_value[:3] in (b'v10', b'v11'):
+            # chrome >=80: 'v10' prefix, 12 byte nonce, then cipher text with the GCM tag
+            if Cipher is None:
+                raise BrowserCookieError('Decrypting Chrome >=80 cookies requires the cryptography package')
+            nonce, cipher_text = encrypted_value[3:15], encrypted_value[15:]
+            return self._cipher.decrypt(nonce, cipher_text, None).decode('utf-8')
+
         _, data = crypt_unprotect_data(encrypted_value)
         assert isinstance(data, bytes)
         return data.decode()
@@ -207,15 +339,57 @@ class Chrome:
         # Encrypted cookies should be prefixed with 'v10' according to the
         # Chromium code. Strip it off.
         encrypted_value = encrypted_value[3:]
-        encrypted_value_half_len = int(len(encrypted_value) / 2)
+
+        if self._cipher is not None:
+            decryptor = self._cipher.decryptor()
+            decrypted = decryptor.update(encrypted_value) + decryptor.finalize()
+            # strip the PKCS#7 padding, the last byte is the padding length
+            padding_length = decrypted[-1] if decrypted else 0
+            if not 1 <= padding_length <= 16 or decrypted[-padding_length:] != bytes([padding_length]) * padding_length:
+                # garbage padding means the cookie was encrypted with a different key,
+                # raise like pyaes does rather than returning a truncated value
+                raise ValueError('invalid padding byte')
+            return decrypted[:-padding_length].decode("utf-8")
 
         cipher = pyaes.Decrypter(pyaes.AESModeOfOperationCBC(self.key, self.iv))
-        decrypted = cipher.feed(encrypted_value[:encrypted_value_half_len])
-        decrypted += cipher.feed(encrypted_value[encrypted_value_half_len:])
+        decrypted = cipher.feed(encrypted_value)
         decrypted += cipher.feed()
         return decrypted.decode("utf-8")
 
 
+def _json_loads(data):
+    """Parse JSON bytes with orjson if available.
+    orjson rejects lone surrogate escapes, which firefox writes for truncated strings,
+    so fall back to the json module for those.
+    """
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(data)
+
+
+@functools.lru_cache(maxsize=4)
+def _read_default_profile(profiles_ini_path, mtime):
+    """Return the relative path of the default profile in a firefox profiles.ini or None.
+    mtime is part of the cache key so that changes to profiles.ini are picked up.
+    """
+    config = configparser.ConfigParser()
+    try:
+        with open(profiles_ini_path) as f:
+            config.read_file(f)
+    except (OSError, configparser.Error):
+        return None
+    for section in config.sections():
+        try:
+            if config[section]['Default'] == '1' and config[section]['IsRelative'] == '1':
+                return config[section]['Path']
+        except KeyError:
+            continue
+    return None
+
+
 class Firefox:
     def __init__(self, cookie_file=None, domain_name=""):
         self.tmp_cookie_file = None
@@ -230,7 +404,11 @@ class Firefox:
     def __del__(self):
         # remove temporary backup of sqlite cookie database
         if self.tmp_cookie_file:
-            os.remove(self.tmp_cookie_file)
+            try:
+                os.remove(self.tmp_cookie_file)
+            except OSError:
+                # on windows the file may still be open or mapped
+                pass
 
     def __str__(self):
         return 'firefox'
@@ -240,48 +418,50 @@ class Firefox:
         """ Given the path to firefox profiles.ini,
             will return relative path to firefox default profile
         """
-        config = configparser.ConfigParser()
-        config.read(profiles_ini_path)
-        for section in config.sections():
-            try:
-                if config[section]['Default'] == '1' and config[section]['IsRelative'] == '1':
-                    return template_for_relative.format(config[section]['Path'])
-            except KeyError:
-                continue
-        return none
+        # glob results may be passed in, use the first match
+        if isinstance(profiles_ini_path, list):
+            profiles_ini_path = profiles_ini_path[0] if profiles_ini_path else None
+        if not profiles_ini_path:
+            return None
+        try:
+            mtime = os.path.getmtime(profiles_ini_path)
+        except OSError:
+            return None
+        profile_path = _read_default_profile(profiles_ini_path, mtime)
+        if profile_path is None:
+            return None
+        return template_for_relative.format(profile_path)
 
     def find_cookie_file(self):
         if sys.platform == 'darwin':
-            profiles_ini_paths = glob.glob(os.path.expanduser('~/Library/Application Support/Firefox/profiles.ini'))
-            profiles_ini_path = self.get_default_profile(profiles_ini_paths, os.path.expanduser('~/Library/Application Support/Firefox/Profiles/{0}/cookies.sqlite'.format(profiles_ini_path)))
-            cookie_files = glob.glob(
-                os.path.expanduser('~/Library/Application Support/Firefox/Profiles/*default/cookies.sqlite')) \
-                or glob.glob(profiles_ini_path)
+            profiles_ini_path = self.get_default_profile(
+                _first_existing(os.path.expanduser('~/Library/Application Support/Firefox/profiles.ini')),
+                os.path.expanduser('~/Library/Application Support/Firefox/{0}/cookies.sqlite'))
+            cookie_file = _first_existing(
+                os.path.expanduser('~/Library/Application Support/Firefox/Profiles/*default/cookies.sqlite'),
+                profiles_ini_path)
         elif sys.platform.startswith('linux'):
-            profiles_ini_paths = glob.glob(os.path.expanduser('~/.mozilla/firefox/profiles.ini'))
-            profiles_ini_path = self.get_default_profile(profiles_ini_paths, os.path.expanduser('~/.mozilla/firefox/{0}/cookies.sqlite'))
-            cookie_files = glob.glob(os.path.expanduser('~/.mozilla/firefox/*default*/cookies.sqlite')) \
-            or glob.glob(profiles_ini_path)
+            profiles_ini_path = self.get_default_profile(
+                _first_existing(os.path.expanduser('~/.mozilla/firefox/profiles.ini')),
+                os.path.expanduser('~/.mozilla/firefox/{0}/cookies.sqlite'))
+            cookie_file = _first_existing(
+                os.path.expanduser('~/.mozilla/firefox/*default*/cookies.sqlite'),
+                profiles_ini_path)
         elif sys.platform == 'win32':
-            profiles_ini_paths = glob.glob(os.path.join(os.environ.get('APPDATA', ''),
-                                                    'Mozilla/Firefox/profiles.ini')) \
-                                    or glob.glob(os.path.join(os.environ.get('LOCALAPPDATA', ''),
-                                                    'Mozilla/Firefox/profiles.ini'))
-            profiles_ini_path = self.get_default_profile(profiles_ini_paths, os.path.join(os.environ.get('APPDATA', ''),
-                                                    "Mozilla/Firefox/{0}/cookies.sqlite"))
-            cookie_files = glob.glob(os.path.join(os.environ.get('PROGRAMFILES', ''), 
-                                                    'Mozilla Firefox/profile/cookies.sqlite')) \
-                            or glob.glob(os.path.join(os.environ.get('PROGRAMFILES(X86)', ''),
-                                                    'Mozilla Firefox/profile/cookies.sqlite')) \
-                            or glob.glob(os.path.join(os.environ.get('APPDATA', ''),
-                                                    'Mozilla/Firefox/Profiles/*default*/cookies.sqlite')) \
-                            or glob.glob(os.path.join(os.environ.get('LOCALAPPDATA', ''),
-                                                    'Mozilla/Firefox/Profiles/*default*/cookies.sqlite')) \
-                            or glob.glob(profiles_ini_path)
+            profiles_ini_path = self.get_default_profile(
+                _first_existing(os.path.join(os.environ.get('APPDATA', ''), 'Mozilla/Firefox/profiles.ini'),
+                                os.path.join(os.environ.get('LOCALAPPDATA', ''), 'Mozilla/Firefox/profiles.ini')),
+                os.path.join(os.environ.get('APPDATA', ''), "Mozilla/Firefox/{0}/cookies.sqlite"))
+            cookie_file = _first_existing(
+                os.path.join(os.environ.get('PROGRAMFILES', ''), 'Mozilla Firefox/profile/cookies.sqlite'),
+                os.path.join(os.environ.get('PROGRAMFILES(X86)', ''), 'Mozilla Firefox/profile/cookies.sqlite'),
+                os.path.join(os.environ.get('APPDATA', ''), 'Mozilla/Firefox/Profiles/*default*/cookies.sqlite'),
+                os.path.join(os.environ.get('LOCALAPPDATA', ''), 'Mozilla/Firefox/Profiles/*default*/cookies.sqlite'),
+                profiles_ini_path)
         else:
             raise BrowserCookieError('Unsupported operating system: ' + sys.platform)
-        if cookie_files:
-            return cookie_files[0]
+        if cookie_file:
+            return cookie_file
         else:
             raise BrowserCookieError('Failed to find Firefox cookie')
 
@@ -295,7 +475,8 @@ class Firefox:
         if not os.path.exists(self.session_file):
             return
         try:
-            json_data = json.loads(open(self.session_file, 'rb').read().decode())
+            with open(self.session_file, 'rb') as file_obj:
+                json_data = _json_loads(file_obj.read())
         except ValueError as e:
             print('Error parsing firefox session JSON:', str(e))
         else:
@@ -307,9 +488,10 @@ class Firefox:
         if not os.path.exists(self.session_file_lz4):
             return
         try:
-            file_obj = open(self.session_file_lz4, 'rb')
-            file_obj.read(8)
-            json_data = json.loads(lz4.block.decompress(file_obj.read()))
+            with open(self.session_file_lz4, 'rb') as file_obj:
+                # skip the mozLz40 magic header
+                file_obj.read(8)
+                json_data = _json_loads(lz4.block.decompress(file_obj.read()))
         except ValueError as e:
             print('Error parsing firefox session JSON LZ4:', str(e))
         else:
@@ -317,16 +499,17 @@ class Firefox:
                 cj.set_cookie(Firefox.__create_session_cookie(cookie))
 
     def load(self):
-        con = sqlite3.connect(self.tmp_cookie_file)
-        cur = con.cursor()
-        cur.execute('select host, path, isSecure, expiry, name, value from moz_cookies '
-                    'where host like "%{}%"'.format(self.domain_name))
+        query = 'select host, path, isSecure, expiry, name, value from moz_cookies'
+        params = ()
+        if self.domain_name:
+            query += ' where instr(host, ?) > 0'
+            params = (self.domain_name.lower(),)
 
         cj = http.cookiejar.CookieJar()
-        for item in cur.fetchall():
-            c = create_cookie(*item)
-            cj.set_cookie(c)
-        con.close()
+        with closing(connect_local_copy(self.tmp_cookie_file)) as con, closing(con.cursor()) as cur:
+            cur.execute(query, params)
+            cookies = [create_cookie(*item) for item in cur]
+        add_cookies(cj, cookies)
 
         self.__add_session_cookies(cj)
         self.__add_session_cookies_lz4(cj)
@@ -334,11 +517,29 @@ class Firefox:
         return cj
 
 
+# Cookie copies the rest dict it is given, so a single instance can be shared
+_EMPTY_REST = {}
+
+
 def create_cookie(host, path, secure, expires, name, value):
     """Shortcut function to create a cookie
     """
-    return http.cookiejar.Cookie(0, name, value, None, False, host, host.startswith('.'), host.startswith('.'), path,
-                                 True, secure, expires, False, None, None, {})
+    domain_initial_dot = host.startswith('.')
+    return http.cookiejar.Cookie(0, name, value, None, False, host, domain_initial_dot, domain_initial_dot, path,
+                                 True, secure, expires, False, None, None, _EMPTY_REST)
+
+
+def add_cookies(cj, cookies):
+    """Add many cookies to a cookiejar, taking its lock once instead of once per cookie
+    """
+    try:
+        with cj._cookies_lock:
+            for c in cookies:
+                cj._cookies.setdefault(c.domain, {}).setdefault(c.path, {})[c.name] = c
+    except AttributeError:
+        # cookiejar internals changed, use the public api
+        for c in cookies:
+            cj.set_cookie(c)
 
 
 def chrome(cookie_file=None, domain_name=""):
@@ -362,8 +563,7 @@ def load(domain_name=""):
     cj = http.cookiejar.CookieJar()
     for cookie_fn in [chrome, firefox]:
         try:
-            for cookie in cookie_fn(domain_name=domain_name):
-                cj.set_cookie(cookie)
+            add_cookies(cj, cookie_fn(domain_name=domain_name))
         except BrowserCookieError:
             pass
     return cj